@@ -0,0 +1,11 @@
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from server import CLEANUP_INTERVAL_MINUTES, init_db, purge_expired_licenses
+
+# Background jobs run in their own process (Procfile "clock") so the web
+# master never holds database connections when it forks workers.
+if __name__ == '__main__':
+    init_db()
+    scheduler = BlockingScheduler()
+    scheduler.add_job(purge_expired_licenses, 'interval', minutes=CLEANUP_INTERVAL_MINUTES)
+    scheduler.start()
@@ -0,0 +1,21 @@
+import os
+from multiprocessing import cpu_count
+
+# Heroku sets PORT and WEB_CONCURRENCY; fall back to sensible local defaults
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 * cpu_count() + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_class = "gthread"
+
+# Import the app once in the master and share it copy-on-write with the workers.
+# Background jobs live in the separate clock process, not here.
+preload_app = True
+
+def when_ready(server):
+    """
+    Creates the schema in the master before any worker is forked, then closes
+    every connection so workers inherit no SQLite handles.
+    """
+    from server import db, init_db
+    init_db()
+    db.engine.dispose()
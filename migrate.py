@@ -0,0 +1,68 @@
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.types import Integer
+
+from server import License, app, db, logger
+
+# One-off migration of an existing license table to the current schema: license_key as the
+# primary key (WITHOUT ROWID on SQLite) and expiration as integer epoch seconds.
+# Safe to run repeatedly; runs in the release phase (see Procfile) before new code serves.
+
+# Converts the legacy naive-UTC DATETIME column to epoch seconds
+EPOCH_EXPRESSIONS = {
+    'sqlite': "CAST(strftime('%s', expiration) AS INTEGER)",
+    'postgresql': "EXTRACT(EPOCH FROM expiration)::bigint",
+}
+
+def migration_engine():
+    """ Engine for the migration, with transactional DDL on SQLite as well. """
+    engine = create_engine(db.engine.url)
+    if engine.dialect.name == 'sqlite':
+        # pysqlite only opens a transaction before DML; emit BEGIN ourselves so the
+        # table rebuild below commits or rolls back as a whole
+        @event.listens_for(engine, "connect")
+        def disable_pysqlite_transactions(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin_transaction(connection):
+            connection.exec_driver_sql("BEGIN")
+    return engine
+
+def migrate_license_table():
+    """ Rebuilds a legacy license table in place, carrying every license over. """
+    with app.app_context():
+        engine = migration_engine()
+    try:
+        with engine.begin() as connection:
+            inspector = inspect(connection)
+            if not inspector.has_table('license'):
+                logger.info("No license table yet; nothing to migrate.")
+                return
+            columns = {column['name']: column for column in inspector.get_columns('license')}
+            expiration_is_epoch = isinstance(columns['expiration']['type'], Integer)
+            if 'id' not in columns and expiration_is_epoch and not columns['expiration']['nullable']:
+                logger.info("License table is already current.")
+                return
+
+            if expiration_is_epoch:
+                epoch = "expiration"
+            else:
+                epoch = EPOCH_EXPRESSIONS[engine.dialect.name]
+            connection.execute(text(
+                f"CREATE TABLE license_legacy AS "
+                f"SELECT license_key, {epoch} AS expiration, assigned_device FROM license "
+                f"WHERE expiration IS NOT NULL"
+            ))
+            connection.execute(text("DROP TABLE license"))
+            License.__table__.create(connection)
+            migrated = connection.execute(text(
+                "INSERT INTO license (license_key, expiration, assigned_device) "
+                "SELECT license_key, expiration, assigned_device FROM license_legacy"
+            )).rowcount
+            connection.execute(text("DROP TABLE license_legacy"))
+    finally:
+        engine.dispose()
+    logger.info(f"Migrated {migrated} licenses to the current schema.")
+
+if __name__ == '__main__':
+    migrate_license_table()
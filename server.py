@@ -1,14 +1,41 @@
 from flask import Flask, request, jsonify
+from flask.json import JSONDecoder, JSONEncoder
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, event, insert, select, text, update
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+from cachetools import TTLCache
 import secrets
+import sqlite3
 import string
+import threading
+import time
 from datetime import datetime, timedelta
 import os
+import re
 import logging
+import orjson
 from zoneinfo import ZoneInfo
 
+class OrjsonEncoder(JSONEncoder):
+    """ Routes jsonify() through orjson's C encoder, honouring Flask's sort/indent settings. """
+    def encode(self, o):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(o, default=self.default, option=option).decode()
+
+class OrjsonDecoder(JSONDecoder):
+    """ Routes request.get_json() through orjson's C decoder. """
+    def decode(self, s):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json_encoder = OrjsonEncoder
+app.json_decoder = OrjsonDecoder
 CORS(app)  # Allow cross-origin requests
 
 # Setup logging configuration
@@ -18,34 +45,144 @@ logger = logging.getLogger(__name__)
 # Configuration setup (add your production URI if deploying in production)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///licenses.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Keep compiled statements cached across requests
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'query_cache_size': 1200}
+
+# Reuse pooled connections, except for in-memory SQLite which must stay on one connection
+database_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+if database_url.get_backend_name() != 'sqlite' or database_url.database not in (None, '', ':memory:'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(
+        pool_size=20,
+        max_overflow=10,
+        pool_recycle=3600,
+    )
+    if database_url.get_backend_name() == 'sqlite':
+        # SQLite file databases otherwise get a NullPool, reconnecting on every checkout
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(
+            poolclass=QueuePool,
+            connect_args={'check_same_thread': False},
+        )
 
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """ Tunes each new SQLite connection: WAL journal, fewer fsyncs and a 20MB page cache. """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 # Timezone for conversion (Asia/Manila)
 ph_tz = ZoneInfo("Asia/Manila")
 
+# Recently probed keys that did not exist, so repeated misses skip the database
+_neg_cache = TTLCache(maxsize=10000, ttl=60)
+_neg_cache_lock = threading.Lock()
+
 # License model for SQLite
 class License(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    license_key = db.Column(db.String(16), unique=True, nullable=False)
-    expiration = db.Column(db.DateTime, nullable=False)
+    # Every lookup is by key, so the key itself is the primary key
+    license_key = db.Column(db.String(19), primary_key=True)
+    # Unix epoch seconds (UTC), indexed so the expiry cleanup can range-scan
+    expiration = db.Column(db.BigInteger, nullable=False, index=True)
     assigned_device = db.Column(db.String(100), nullable=True)
 
+    # Store rows directly in the primary key btree on SQLite
+    __table_args__ = {'sqlite_with_rowid': False}
+
     def __repr__(self):
         return f'<License {self.license_key}>'
 
+# Statements built once at import so each request only binds parameters
+_verify_stmt = select(License).where(License.license_key == bindparam('k'))
+_insert_stmt = insert(License)
+_assign_device_stmt = (
+    update(License)
+    .where(
+        License.license_key == bindparam('k'),
+        License.assigned_device.is_(None),
+        License.expiration > bindparam('now'),
+    )
+    .values(assigned_device=bindparam('device_id'))
+    .execution_options(synchronize_session=False)
+)
+
 # Initialize the database (run this once to create the schema)
 @app.before_first_request
 def create_tables():
     db.create_all()
 
-def generate_random_key(length=16, group_size=4):
+def init_db():
+    """ Creates the schema before any request is served; called from gunicorn's when_ready hook. """
+    with app.app_context():
+        db.create_all()
+
+# Expired licenses are purged in batches by the clock process (clock.py) instead of on the verify path
+CLEANUP_INTERVAL_MINUTES = 5
+CLEANUP_BATCH_SIZE = 1000
+
+_delete_expired_batch = text(
+    "DELETE FROM license WHERE license_key IN "
+    "(SELECT license_key FROM license WHERE expiration < :now LIMIT :batch_size)"
+)
+
+def purge_expired_licenses():
+    """ Deletes expired licenses in batches until none are left. """
+    with app.app_context():
+        total = 0
+        while True:
+            result = db.session.execute(
+                _delete_expired_batch,
+                {"now": int(time.time()), "batch_size": CLEANUP_BATCH_SIZE}
+            )
+            db.session.commit()
+            if result.rowcount <= 0:
+                break
+            total += result.rowcount
+        db.session.remove()
+        if total:
+            logger.info(f"Purged {total} expired licenses.")
+
+KEY_ALPHABET = (string.ascii_uppercase + string.digits).encode()
+
+KEY_LENGTH = 16
+
+# Shape of every issued key; anything else cannot exist and is rejected up front
+LICENSE_KEY_PATTERN = re.compile(r'[A-Z0-9]{4}(?:-[A-Z0-9]{4}){3}')
+
+# bytes.translate() maps each random byte to KEY_ALPHABET[b % 36] in C; bytes 252..255
+# are deleted because keeping them would bias the modulo towards the first four symbols
+_KEY_BYTE_TABLE = bytes(KEY_ALPHABET[b % len(KEY_ALPHABET)] for b in range(256))
+_KEY_BYTE_REJECT = bytes(range(256 - 256 % len(KEY_ALPHABET), 256))
+
+def _random_key_chars(n):
+    """ Returns at least n uniformly distributed alphabet characters. """
+    chars = b''
+    while len(chars) < n:
+        chars += secrets.token_bytes(n + n // 16 + 4).translate(_KEY_BYTE_TABLE, _KEY_BYTE_REJECT)
+    return chars.decode()
+
+def generate_random_key():
     """
     Generates a random license key in the format: ABCD-EFGH-IJKL-MNOP
     """
-    alphabet = string.ascii_uppercase + string.digits
-    raw_key = ''.join(secrets.choice(alphabet) for _ in range(length))
-    return '-'.join(raw_key[i:i+group_size] for i in range(0, length, group_size))
+    s = _random_key_chars(KEY_LENGTH)
+    return f"{s[0:4]}-{s[4:8]}-{s[8:12]}-{s[12:16]}"
+
+def generate_random_keys(count):
+    """ Generates count distinct license keys from a single bulk entropy draw. """
+    keys = set()
+    while len(keys) < count:
+        needed = count - len(keys)
+        s = _random_key_chars(KEY_LENGTH * needed)
+        for i in range(0, KEY_LENGTH * needed, KEY_LENGTH):
+            keys.add(f"{s[i:i+4]}-{s[i+4:i+8]}-{s[i+8:i+12]}-{s[i+12:i+16]}")
+    return list(keys)
 
 def parse_duration(duration_str):
     """ Helper function to parse the duration string into a timedelta object. """
@@ -57,6 +194,16 @@ def parse_duration(duration_str):
     except ValueError:
         return timedelta(days=1)  # Default to 1 day if invalid input
 
+MAX_BATCH_LICENSES = 1000
+
+def parse_count(count):
+    """ Helper function to parse the batch size, clamped to 1..MAX_BATCH_LICENSES. """
+    try:
+        count = int(count)
+    except (TypeError, ValueError):
+        return 1  # Default to a single license if invalid input
+    return max(1, min(count, MAX_BATCH_LICENSES))
+
 @app.route('/owner/generate_license', methods=['POST'])
 def owner_generate_license():
     """
@@ -66,21 +213,22 @@ def owner_generate_license():
     payload = request.get_json(silent=True) or {}
     duration = payload.get("duration", "1")  # Default to 1 day if no duration provided
     
-    expiration_utc = datetime.utcnow() + parse_duration(duration)
+    expiration = int(time.time() + parse_duration(duration).total_seconds())
 
     new_key = generate_random_key()
 
     # Store the license in the database
-    new_license = License(
-        license_key=new_key,
-        expiration=expiration_utc,
-        assigned_device=None
-    )
-    db.session.add(new_license)
+    db.session.execute(_insert_stmt, {
+        "license_key": new_key,
+        "expiration": expiration,
+        "assigned_device": None
+    })
     db.session.commit()
+    with _neg_cache_lock:
+        _neg_cache.pop(new_key, None)
 
     # Convert the UTC expiration to Philippine Time (Asia/Manila)
-    expiration_ph = expiration_utc.astimezone(ph_tz)
+    expiration_ph = datetime.fromtimestamp(expiration, ph_tz)
 
     logger.debug(f"Generated new license: {new_key}, expires at {expiration_ph.isoformat()}")
 
@@ -89,6 +237,40 @@ def owner_generate_license():
         "expires_at": expiration_ph.isoformat()
     })
 
+@app.route('/owner/generate_licenses', methods=['POST'])
+def owner_generate_licenses():
+    """
+    Generates a batch of license keys sharing one expiration, stored in a single transaction.
+    Expects JSON payload like: { "count": 50, "duration": "30" }
+    """
+    payload = request.get_json(silent=True) or {}
+    count = parse_count(payload.get("count", 1))
+    duration = payload.get("duration", "1")  # Default to 1 day if no duration provided
+
+    expiration = int(time.time() + parse_duration(duration).total_seconds())
+
+    new_keys = generate_random_keys(count)
+
+    # One executemany and one commit for the whole batch
+    db.session.execute(_insert_stmt, [
+        {"license_key": key, "expiration": expiration, "assigned_device": None}
+        for key in new_keys
+    ])
+    db.session.commit()
+    with _neg_cache_lock:
+        for key in new_keys:
+            _neg_cache.pop(key, None)
+
+    # Convert the UTC expiration to Philippine Time (Asia/Manila)
+    expiration_ph = datetime.fromtimestamp(expiration, ph_tz)
+
+    logger.debug(f"Generated {count} new licenses, expiring at {expiration_ph.isoformat()}")
+
+    return jsonify({
+        "license_keys": new_keys,
+        "expires_at": expiration_ph.isoformat()
+    })
+
 @app.route('/client/verify_license', methods=['GET'])
 def verify_license():
     """
@@ -103,26 +285,49 @@ def verify_license():
         logger.error(error_message)
         return jsonify({"valid": False, "error": error_message}), 400
 
-    # Retrieve the license from the database
-    license_data = License.query.filter_by(license_key=license_key).first()
+    # Malformed keys never reach the negative cache, which would otherwise grow
+    # with arbitrarily long client-supplied strings
+    if not LICENSE_KEY_PATTERN.fullmatch(license_key):
+        return jsonify({"valid": False, "error": "License key not found"})
+
+    with _neg_cache_lock:
+        known_missing = license_key in _neg_cache
+    if known_missing:
+        return jsonify({"valid": False, "error": "License key not found"})
+
+    # Retrieve the license from the database; nothing is pending, so skip the autoflush
+    with db.session.no_autoflush:
+        license_data = db.session.execute(_verify_stmt, {'k': license_key}).scalar_one_or_none()
 
     if not license_data:
+        with _neg_cache_lock:
+            _neg_cache[license_key] = True
         logger.warning(f"License key {license_key} not found.")
         return jsonify({"valid": False, "error": "License key not found"})
 
     # Check if expired
-    if datetime.utcnow() >= license_data.expiration:
-        db.session.delete(license_data)  # Remove expired license from database
-        db.session.commit()
+    if int(time.time()) >= license_data.expiration:
+        # Left for purge_expired_licenses to delete in bulk
         logger.info(f"License key {license_key} expired.")
         return jsonify({"valid": False, "error": "License key expired"})
 
     # Check if assigned device matches
     if license_data.assigned_device is None:
-        license_data.assigned_device = device_id
-        db.session.commit()  # Save the device assignment in the database
-        logger.info(f"License key {license_key} assigned to device {device_id}.")
-        return jsonify({"valid": True})
+        # Only claims the key if no other request assigned a device in the meantime
+        rows = db.session.execute(
+            _assign_device_stmt,
+            {'k': license_key, 'device_id': device_id, 'now': int(time.time())}
+        ).rowcount
+        db.session.commit()
+        if rows == 1:
+            logger.info(f"License key {license_key} assigned to device {device_id}.")
+            return jsonify({"valid": True})
+        # Lost the race or the key expired meanwhile; re-select explicitly, since
+        # the cleanup job may already have deleted an expired row
+        license_data = db.session.execute(_verify_stmt, {'k': license_key}).scalar_one_or_none()
+        if license_data is None or license_data.assigned_device is None:
+            logger.info(f"License key {license_key} expired.")
+            return jsonify({"valid": False, "error": "License key expired"})
 
     if license_data.assigned_device == device_id:
         logger.info(f"License key {license_key} validated for device {device_id}.")
@@ -133,5 +338,7 @@ def verify_license():
 
 if __name__ == '__main__':
     # Use the PORT environment variable if available, otherwise default to 5000.
+    # Local development only; production runs wsgi:application under gunicorn.
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    init_db()
+    app.run(host="0.0.0.0", port=port, debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -0,0 +1,4 @@
+from server import app
+
+# WSGI entry point for gunicorn (see gunicorn_conf.py)
+application = app